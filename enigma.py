@@ -1,10 +1,19 @@
-# EXTERNAL DEPENDENCIES: winter (https://github.com/mk8-bruh/winter.py)
+# EXTERNAL DEPENDENCIES: winter (https://github.com/mk8-bruh/winter.py), only for the interface
 
 from __future__ import annotations
-from winter import *
+try:
+    from winter import Program, ProgramState, Terminal, centerString
+except ImportError:
+    # only the interface needs winter, the logic can be imported without it
+    (Program, ProgramState) = (None, object)
 from math import floor, ceil
 from re import finditer
 from textwrap import wrap as twrap
+from time import perf_counter
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from typing import Callable
+from bisect import bisect_right
 
 def wrap(sequence: str|list|tuple, length: int):
     return [sequence[i: i + length] for i in range(0, len(sequence), length)]
@@ -24,18 +33,61 @@ def lton(l: str):
 
 # logic
 
+class Stats:
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        self.timers: dict[str, float] = {}
+        self.hooks: list[Callable[[dict[str, int], dict[str, float]], None]] = []
+    def Count(self, key: str, n: int = 1):
+        self.counters[key] = self.counters.get(key, 0) + n
+    def Time(self, key: str, seconds: float):
+        self.timers[key] = self.timers.get(key, 0.0) + seconds
+    def AddHook(self, hook: Callable[[dict[str, int], dict[str, float]], None]):
+        self.hooks.append(hook)
+    def Export(self):
+        counters, timers = dict(self.counters), dict(self.timers)
+        for hook in self.hooks:
+            hook(counters, timers)
+        return counters, timers
+    def Reset(self):
+        self.counters.clear()
+        self.timers.clear()
+
+# instrumentation is off while this is None, the hot paths only pay for one global lookup
+stats: Stats = None
+
+def EnableStats(hook: Callable[[dict[str, int], dict[str, float]], None] = None):
+    global stats
+    stats = Stats()
+    if hook:
+        stats.AddHook(hook)
+    return stats
+
+def DisableStats():
+    global stats
+    (s, stats) = (stats, None)
+    return s
+
 class Rotor:
-    def __init__(self, wiring: str = "ABCDEFGHIJKLMNOPQRSTUVWXYZ", notches: str = "", position: str = "A", next: Rotor = None, name: str = None):
+    def __init__(self, wiring: str = "ABCDEFGHIJKLMNOPQRSTUVWXYZ", notches: str = "", position: str = "A", next: Rotor = None, name: str = None, ring: str = "A", fixed: bool = False):
         self.wiring:  list[int] = [lton(p) for p in wiring ] if type(wiring ) == str else wiring
         self.notches: list[int] = [lton(n) for n in notches] if type(notches) == str else notches
         self.position = lton(position)
+        self.ring = lton(ring)
+        self.fixed = fixed  # never steps, like the greek rotor of the M4
         self.stepped = False
         self.doublestep = False
         self.next = next
         self.name = name
     def Step(self):
-        if self.next:
+        if self.fixed:
+            return
+        if stats:
+            stats.Count("rotor.step")
+        if self.next and not self.next.fixed:
             if self.next.doublestep and self.doublestep:
+                if stats:
+                    stats.Count("rotor.doublestep")
                 self.next.Step()
                 self.next.doublestep = False
             if self.position in self.notches:
@@ -45,12 +97,12 @@ class Rotor:
         self.position %= 26
     def Transform(self, letter: str):
         letter = lton(letter)
-        return ntol(self.wiring[(letter - self.position) % 26] + self.position)
+        return ntol(self.wiring[(letter - self.position + self.ring) % 26] + self.position - self.ring)
     def Inverse(self, letter: str):
         letter = lton(letter)
-        return ntol(self.wiring.index((letter - self.position) % 26) + self.position)
-    def Instantiate(self, position: str = "A", next: Rotor = None):
-        return Rotor(self.wiring, self.notches, position, next, self.name)
+        return ntol(self.wiring.index((letter - self.position + self.ring) % 26) + self.position - self.ring)
+    def Instantiate(self, position: str = "A", next: Rotor = None, ring: str = "A"):
+        return Rotor(self.wiring, self.notches, position, next, self.name, ring, self.fixed)
 
 rotors = {
     "1": Rotor("EKMFLGDQVZNTOWYHXUSPAIBRCJ", "R",  name = "I"   ),
@@ -62,6 +114,10 @@ rotors = {
 	"7": Rotor("NZJHGRCXMYSWBOUFAIVLPEKQDT", "AN", name = "VII" ),
 	"8": Rotor("FKQHTLXOCBJSPDZRAMEWNIUYGV", "AN", name = "VIII"),
 
+    # M4 greek rotors, only used in the fourth slot together with a thin reflector
+    "b": Rotor("LEYJVCNIXWPBQMDRTAKZGFUHOS", name = "Beta",  fixed = True),
+    "g": Rotor("FSOKANUQBJDXTPZYMEWHLIRGVC", name = "Gamma", fixed = True),
+
     "0": Rotor(name = "NaN")
 }
 
@@ -96,9 +152,15 @@ class Swapper:
 reflectors = {
     "A": Swapper(['AE', 'BJ', 'CM', 'DZ', 'FL', 'GY', 'HX', 'IV', 'KW', 'NR', 'OQ', 'PU', 'ST'], name = "A"),
     "B": Swapper(['AY', 'BR', 'CU', 'DH', 'EQ', 'FS', 'GL', 'IP', 'JX', 'KN', 'MO', 'TZ', 'VW'], name = "B"),
-    "C": Swapper(['AF', 'BV', 'CP', 'DJ', 'EI', 'GO', 'HY', 'KR', 'LZ', 'MX', 'NW', 'QT', 'SU'], name = "C")
+    "C": Swapper(['AF', 'BV', 'CP', 'DJ', 'EI', 'GO', 'HY', 'KR', 'LZ', 'MX', 'NW', 'QT', 'SU'], name = "C"),
+
+    # M4 thin reflectors
+    "b": Swapper(['AE', 'BN', 'CK', 'DQ', 'FU', 'GY', 'HW', 'IJ', 'LO', 'MP', 'RX', 'SZ', 'TV'], name = "B-thin"),
+    "c": Swapper(['AR', 'BD', 'CO', 'EJ', 'FN', 'GT', 'HK', 'IV', 'LM', 'PW', 'QZ', 'SX', 'UY'], name = "C-thin")
 }
 
+THIN_REFLECTORS = ["b", "c"]
+
 class Enigma:
     def __init__(self, rotors: list[Rotor], reflector: Swapper, plugboard: Swapper):
         self.rotors = rotors
@@ -107,6 +169,8 @@ class Enigma:
         self.reflector = reflector
         self.plugboard = plugboard
     def Transform(self, c: str):
+        if stats:
+            return self.TimedTransform(c)
         c = self.plugboard.Transform(c)
         for r in self.rotors:
             c = r.Transform(c)
@@ -114,6 +178,25 @@ class Enigma:
         for r in reversed(self.rotors):
             c = r.Inverse(c)
         return self.plugboard.Transform(c)
+    def TimedTransform(self, c: str):
+        t0 = perf_counter()
+        c = self.plugboard.Transform(c)
+        t1 = perf_counter()
+        for r in self.rotors:
+            c = r.Transform(c)
+        t2 = perf_counter()
+        c = self.reflector.Transform(c)
+        t3 = perf_counter()
+        for r in reversed(self.rotors):
+            c = r.Inverse(c)
+        t4 = perf_counter()
+        c = self.plugboard.Transform(c)
+        t5 = perf_counter()
+        stats.Count("enigma.transform")
+        stats.Time("enigma.plugboard", (t1 - t0) + (t5 - t4))
+        stats.Time("enigma.rotors", (t2 - t1) + (t4 - t3))
+        stats.Time("enigma.reflector", t3 - t2)
+        return c
     def Enter(self, c: str):
         if len(self.rotors) > 0:
             self.rotors[0].Step()
@@ -123,13 +206,149 @@ class Enigma:
         for c in txt:
             res += self.Enter(c)
         return res
+    def Dump(self):
+        if len(self.rotors) > SNAPSHOT_ROTORS:
+            raise ValueError(f"snapshots hold at most {SNAPSHOT_ROTORS} rotors")
+        fields = []
+        for r in self.rotors:
+            if r.name not in ROTOR_IDS:
+                raise ValueError(f"rotor {r.name!r} is not in the rotor table")
+            fields += [ROTOR_IDS[r.name].encode(), r.position, r.ring, r.doublestep]
+        fields += [b"0", 0, 0, False] * (SNAPSHOT_ROTORS - len(self.rotors))
+        if self.reflector.name not in REFLECTOR_IDS:
+            raise ValueError(f"reflector {self.reflector.name!r} is not in the reflector table")
+        return SNAPSHOT.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, len(self.rotors), REFLECTOR_IDS[self.reflector.name].encode(), *fields, "".join(self.plugboard.pairs).encode())
+    @staticmethod
+    def Load(data: bytes):
+        (magic, version, count, reflector, *fields, pairs) = SNAPSHOT.unpack(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("not an Enigma snapshot of a supported version")
+        if count > SNAPSHOT_ROTORS:
+            raise ValueError(f"snapshot has {count} rotors, at most {SNAPSHOT_ROTORS} fit")
+        if reflector.decode("latin-1") not in reflectors:
+            raise ValueError(f"unknown reflector {reflector!r} in snapshot")
+        pairs = pairs.rstrip(b"\0").decode("latin-1")
+        if len(pairs) % 2 or len(set(pairs)) != len(pairs) or any(not "A" <= c <= "Z" for c in pairs):
+            raise ValueError(f"invalid plugboard {pairs!r} in snapshot")
+        machine = []
+        for i in range(count):
+            (key, position, ring, doublestep) = fields[4 * i : 4 * i + 4]
+            if key.decode("latin-1") not in rotors:
+                raise ValueError(f"unknown rotor {key!r} in snapshot")
+            if position >= 26 or ring >= 26:
+                raise ValueError(f"rotor {i} has position {position} and ring {ring} in snapshot, both have to be below 26")
+            r = rotors[key.decode()].Instantiate()
+            r.position = position
+            r.ring = ring
+            r.doublestep = bool(doublestep)
+            machine.append(r)
+        return Enigma(machine, reflectors[reflector.decode()].Instantiate(), Swapper(wrap(pairs, 2)))
 
-# interface
+# fixed-size records, so a file of snapshots can be indexed without parsing it
+# magic, version, rotor count, reflector, (rotor id, position, ring, doublestep) per rotor slot, plugboard pairs
+SNAPSHOT_MAGIC = b"EN"
+SNAPSHOT_VERSION = 2
+SNAPSHOT_ROTORS = 4
+SNAPSHOT = Struct("<2sBBc" + "cBB?" * SNAPSHOT_ROTORS + "26s")
+
+ROTOR_IDS = {r.name: key for (key, r) in rotors.items()}
+REFLECTOR_IDS = {r.name: key for (key, r) in reflectors.items()}
+
+def SaveSnapshots(path: str, machines: list[Enigma], append: bool = False):
+    with open(path, "ab" if append else "wb") as f:
+        for m in machines:
+            f.write(m.Dump())
+
+class SnapshotFile:
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+    def __len__(self):
+        return len(self.data) // SNAPSHOT.size
+    def __getitem__(self, i: int):
+        if not -len(self) <= i < len(self):
+            raise IndexError("snapshot index out of range")
+        i %= len(self)
+        return Enigma.Load(self.data[i * SNAPSHOT.size : (i + 1) * SNAPSHOT.size])
+    def Close(self):
+        self.data.close()
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.Close()
 
-window = Program(41, 13, "ENIGMA", killKey = "escape")
+# table-driven equivalent of Enigma for bulk work, rotors are given as keys of `rotors` in the same order (fastest first)
+# rotors from the first fixed one onwards never move, so they are folded into the reflector table whenever the positions change
+class FastEnigma:
+    def __init__(self, order: str|list[str], reflector: str, plugboard: list[str] = [], rings: str = ""):
+        self.order = list(order)
+        self.forward: list[list[list[int]]] = []
+        self.inverse: list[list[list[int]]] = []
+        self.notches: list[list[int]] = []
+        self.moving = next((i for (i, key) in enumerate(self.order) if rotors[key].fixed), len(self.order))
+        rings = [lton(r) for r in rings] + [0] * (len(self.order) - len(rings))
+        for (key, ring) in zip(self.order, rings):
+            r = rotors[key]
+            forward = [[(r.wiring[(c - p + ring) % 26] + p - ring) % 26 for c in range(26)] for p in range(26)]
+            inverse = [[0] * 26 for p in range(26)]
+            for p in range(26):
+                for c in range(26):
+                    inverse[p][forward[p][c]] = c
+            self.forward.append(forward)
+            self.inverse.append(inverse)
+            self.notches.append(list(r.notches))
+        self.reflect = [lton(reflectors[reflector].Transform(ntol(c))) for c in range(26)]
+        plugs = Swapper(plugboard)
+        self.plugboard = [lton(plugs.Transform(ntol(c))) for c in range(26)]
+        self.SetPositions("")
+    def SetPositions(self, positions: str):
+        self.positions = [lton(p) for p in positions] + [0] * (len(self.order) - len(positions))
+        self.doublestep = [False] * len(self.order)
+        self.reflector = []
+        for c in range(26):
+            for i in range(self.moving, len(self.order)):
+                c = self.forward[i][self.positions[i]][c]
+            c = self.reflect[c]
+            for i in reversed(range(self.moving, len(self.order))):
+                c = self.inverse[i][self.positions[i]][c]
+            self.reflector.append(c)
+    def Step(self, i: int = 0):
+        if i + 1 < self.moving:
+            if self.doublestep[i + 1] and self.doublestep[i]:
+                self.Step(i + 1)
+                self.doublestep[i + 1] = False
+            if self.positions[i] in self.notches[i]:
+                self.Step(i + 1)
+                self.doublestep[i] = True
+        self.positions[i] = (self.positions[i] + 1) % 26
+    def Encode(self, txt: str):
+        (forward, inverse, reflector, plugboard, positions) = (self.forward, self.inverse, self.reflector, self.plugboard, self.positions)
+        slots = range(self.moving)
+        res = []
+        for ch in txt.upper():
+            c = ord(ch) - 65
+            if not 0 <= c < 26:
+                res.append(ch)
+                continue
+            if self.moving:
+                self.Step()
+            c = plugboard[c]
+            for i in slots:
+                c = forward[i][positions[i]][c]
+            c = reflector[c]
+            for i in reversed(slots):
+                c = inverse[i][positions[i]][c]
+            res.append(chr(65 + plugboard[c]))
+        return "".join(res)
+
+# interface
 
 ALPHABET = [chr(i + 65) for i in range(26)]
 
+# undo keeps the full rotor state only every this many letters and replays the stepping in between
+CHECKPOINT_INTERVAL = 32
+
 class Main(ProgramState):
     def __init__(self):
         self.mode = "text"  # 'text' / 'rotor' / 'plugboard' / 'reflector'
@@ -144,7 +363,36 @@ class Main(ProgramState):
         self.plugboard_input = ""
         
         self.cipher = Enigma([rotors["1"].Instantiate(), rotors["2"].Instantiate(), rotors["3"].Instantiate()], reflectors["A"].Instantiate(), Swapper())
-        self.rotor_stack = []
+        # (letters typed, rotor ids, (position, doublestep) of every rotor) before the next letter
+        self.checkpoints: list[tuple[int, tuple[str, ...], tuple[tuple[int, bool], ...]]] = []
+        self.replay = None  # (checkpoint, states after it) of the last replayed stretch
+        self.letters = 0
+        self.rotors_changed = False
+
+    def Checkpoint(self):
+        checkpoint = (self.letters, tuple(ROTOR_IDS[r.name] for r in self.cipher.rotors), tuple((r.position, r.doublestep) for r in self.cipher.rotors))
+        if self.checkpoints and self.checkpoints[-1][0] == self.letters:
+            self.checkpoints[-1] = checkpoint
+        else:
+            self.checkpoints.append(checkpoint)
+        self.rotors_changed = False
+
+    def StateAt(self, letters: int):
+        checkpoint = self.checkpoints[bisect_right(self.checkpoints, letters, key = lambda c: c[0]) - 1]
+        (start, ids, state) = checkpoint
+        if self.replay is None or self.replay[0] is not checkpoint:
+            self.replay = (checkpoint, [state])
+        states = self.replay[1]
+        if letters - start >= len(states):
+            scratch = [rotors[i].Instantiate() for i in ids]
+            for i in range(len(scratch) - 1):
+                scratch[i].next = scratch[i + 1]
+            for (r, (position, doublestep)) in zip(scratch, states[-1]):
+                r.position, r.doublestep = position, doublestep
+            while letters - start >= len(states):
+                scratch[0].Step()
+                states.append(tuple((r.position, r.doublestep) for r in scratch))
+        return states[letters - start]
 
     def Enter(self, prev):
         window.Clear()
@@ -254,9 +502,12 @@ class Main(ProgramState):
                 self.scroll += 1
             elif key == "backspace":
                 if len(self.plaintext) > 0:
-                    if self.plaintext[-1] in ALPHABET and len(self.rotor_stack) > 0:
-                        for (i, p) in enumerate(self.rotor_stack.pop(-1)):
-                            self.cipher.rotors[i].position = p
+                    if self.plaintext[-1] in ALPHABET and self.letters > 0:
+                        self.letters -= 1
+                        for (rotor, (position, doublestep)) in zip(self.cipher.rotors, self.StateAt(self.letters)):
+                            rotor.position, rotor.doublestep = position, doublestep
+                        while self.checkpoints[-1][0] > self.letters:
+                            self.checkpoints.pop()
                     self.plaintext = self.plaintext[:-1]
                     self.ciphertext = self.ciphertext[:-1]
                 self.scroll = -1
@@ -275,7 +526,9 @@ class Main(ProgramState):
                 ch = key.upper()
                 self.plaintext += ch
                 if ch in ALPHABET:
-                    self.rotor_stack.append(tuple(rotor.position for rotor in self.cipher.rotors))
+                    if self.rotors_changed or not self.checkpoints or self.checkpoints[-1][1] != tuple(ROTOR_IDS[r.name] for r in self.cipher.rotors) or self.letters - self.checkpoints[-1][0] >= CHECKPOINT_INTERVAL:
+                        self.Checkpoint()
+                    self.letters += 1
                     self.ciphertext += self.cipher.Enter(ch)
                 else:
                     self.ciphertext += ch
@@ -297,15 +550,20 @@ class Main(ProgramState):
                 notches = [(n - self.cipher.rotors[p].position) % 26 for n in self.cipher.rotors[p].notches if n != self.cipher.rotors[p].position]
                 if len(notches) > 0:
                     self.cipher.rotors[p].position = (min(notches) + self.cipher.rotors[p].position) % 26
+                    self.rotors_changed = True
             elif key == "tab":
                 self.mode = "text"
                 self.scroll = -1
             else:
                 ch = key.upper()
                 if ch in rotors:
-                    self.cipher.rotors[p] = rotors[ch].Instantiate()
+                    self.cipher.rotors[p] = rotors[ch].Instantiate(next = self.cipher.rotors[p + 1] if p + 1 < len(self.cipher.rotors) else None)
+                    if p > 0:
+                        self.cipher.rotors[p - 1].next = self.cipher.rotors[p]
+                    self.rotors_changed = True
                 elif ch in ALPHABET:
                     self.cipher.rotors[p].position = lton(ch)
+                    self.rotors_changed = True
             self.rotor_cursor = p
 
         elif self.mode == "reflector":
@@ -397,8 +655,12 @@ class Main(ProgramState):
 
         self.Draw()
 
-main = Main()
+if __name__ == "__main__":
+    if Program is None:
+        raise ImportError("the interface needs winter (https://github.com/mk8-bruh/winter.py)")
+    window = Program(41, 13, "ENIGMA", killKey = "escape")
+    main = Main()
 
-window.Run(main)
+    window.Run(main)
 
-print(main.ciphertext)
\ No newline at end of file
+    print(main.ciphertext)
\ No newline at end of file
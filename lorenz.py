@@ -1,9 +1,16 @@
-# EXTERNAL DEPENDENCIES: winter (https://github.com/mk8-bruh/winter.py)
+# EXTERNAL DEPENDENCIES: winter (https://github.com/mk8-bruh/winter.py), only for the interface
 
 from __future__ import annotations
-from winter import *
+try:
+    from winter import Program, ProgramState, Terminal, centerString
+except ImportError:
+    # only the interface needs winter, the logic can be imported without it
+    (Program, ProgramState) = (None, object)
 from math import floor, ceil
 from re import finditer
+from typing import Callable
+from mmap import mmap, ACCESS_READ
+from struct import Struct
 
 def wrap(sequence: str|list|tuple, length: int):
     return [sequence[i: i + length] for i in range(0, len(sequence), length)]
@@ -54,6 +61,41 @@ BAUDOT = {
 
 BAUDOT_REV = {v:k for k,v in BAUDOT.items()}
 
+class Stats:
+    def __init__(self):
+        self.counters: dict[str, int] = {}
+        self.hooks: list[Callable[[dict[str, int]], None]] = []
+    
+    def count(self, key: str, n: int = 1):
+        self.counters[key] = self.counters.get(key, 0) + n
+    
+    def add_hook(self, hook: Callable[[dict[str, int]], None]):
+        self.hooks.append(hook)
+    
+    def export(self):
+        counters = dict(self.counters)
+        for hook in self.hooks:
+            hook(counters)
+        return counters
+    
+    def reset(self):
+        self.counters.clear()
+
+# instrumentation is off while this is None, the hot paths only pay for one global lookup
+stats: Stats = None
+
+def enable_stats(hook: Callable[[dict[str, int]], None] = None):
+    global stats
+    stats = Stats()
+    if hook:
+        stats.add_hook(hook)
+    return stats
+
+def disable_stats():
+    global stats
+    (s, stats) = (stats, None)
+    return s
+
 class LorenzWheel:
     def __init__(self, size: int, pins: str = None, position: int = 0, name: str = None):
         self.size = size
@@ -101,16 +143,23 @@ class LorenzSZ:
         self.scroll = 0
     
     def step_wheels(self):
+        motor = self.motor_wheels[0].current_pin() == 1
+        if stats:
+            stats.count("step_wheels")
+            if motor:
+                stats.count("step_wheels.motor")
         for (i, wheel) in enumerate(self.chi_wheels):
             wheel.step()
-        for (i, wheel) in enumerate(self.psi_wheels):
-            if self.motor_wheels[0].current_pin() == 1:
+        if motor:
+            for (i, wheel) in enumerate(self.psi_wheels):
                 wheel.step()
         for (i, wheel) in enumerate(self.motor_wheels):
             if i + 1 >= len(self.motor_wheels) or self.motor_wheels[i + 1].current_pin() == 1:
                 wheel.step()
     
     def encrypt_char(self, char: str):
+        if stats:
+            stats.count("encrypt_char")
         if char not in BAUDOT:
             return char
         
@@ -129,6 +178,32 @@ class LorenzSZ:
         
         return BAUDOT_REV.get(encrypted, '?')
     
+    def wheels(self):
+        return self.chi_wheels + self.psi_wheels + self.motor_wheels
+    
+    def dump(self):
+        wheels = self.wheels()
+        bits = b"".join(bytes(wheel.pins) for wheel in wheels).translate(PIN_DIGITS)
+        return SNAPSHOT.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, *(wheel.position for wheel in wheels), int(bits, 2).to_bytes(SNAPSHOT_PIN_BYTES, "big"))
+    
+    def load(self, data: bytes):
+        (magic, version, *positions, pins) = SNAPSHOT.unpack(data)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise ValueError("not a Lorenz snapshot of a supported version")
+        for (wheel, position) in zip(self.wheels(), positions):
+            if position >= wheel.size:
+                raise ValueError(f"wheel {wheel.name} has position {position} in snapshot, but only {wheel.size} positions")
+        pins = int.from_bytes(pins, "big")
+        if pins >> SNAPSHOT_PIN_BITS:
+            raise ValueError("snapshot has pins set past the last wheel")
+        bits = format(pins, f"0{SNAPSHOT_PIN_BITS}b").encode().translate(DIGIT_PINS)
+        offset = 0
+        for (wheel, position) in zip(self.wheels(), positions):
+            wheel.pins = list(bits[offset : offset + wheel.size])
+            wheel.position = position
+            offset += wheel.size
+        return self
+    
     def process_char(self, char: str):
         if char in BAUDOT:
             encrypted = self.encrypt_char(char.upper())
@@ -140,9 +215,46 @@ class LorenzSZ:
             self.ciphertext += char
         self.scroll = -1
 
-# interface
+# fixed-size records, so a file of snapshots can be indexed without parsing it
+# magic, version, position of every wheel, pins of every wheel packed into bits (chi, psi, motor)
+SNAPSHOT_MAGIC = b"LZ"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PIN_BITS = sum(wheel.size for wheel in LorenzSZ().wheels())
+SNAPSHOT_PIN_BYTES = (SNAPSHOT_PIN_BITS + 7) // 8
+SNAPSHOT = Struct(f"<2sB{len(LorenzSZ().wheels())}B{SNAPSHOT_PIN_BYTES}s")
+PIN_DIGITS = bytes.maketrans(b"\0\1", b"01")
+DIGIT_PINS = bytes.maketrans(b"01", b"\0\1")
+
+def save_snapshots(path: str, machines: list[LorenzSZ], append: bool = False):
+    with open(path, "ab" if append else "wb") as f:
+        for m in machines:
+            f.write(m.dump())
+
+class SnapshotFile:
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+    
+    def __len__(self):
+        return len(self.data) // SNAPSHOT.size
+    
+    def __getitem__(self, i: int):
+        if not -len(self) <= i < len(self):
+            raise IndexError("snapshot index out of range")
+        i %= len(self)
+        return LorenzSZ().load(self.data[i * SNAPSHOT.size : (i + 1) * SNAPSHOT.size])
+    
+    def close(self):
+        self.data.close()
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *args):
+        self.close()
 
-window = Program(41, 13, "LORENZ SZ", killKey="escape")
+# interface
 
 class Main(ProgramState):
     def __init__(self):
@@ -365,6 +477,10 @@ class Main(ProgramState):
         
         Terminal.Flush()
 
-main = Main()
-window.Run(main)
-print(main.machine.ciphertext)
\ No newline at end of file
+if __name__ == "__main__":
+    if Program is None:
+        raise ImportError("the interface needs winter (https://github.com/mk8-bruh/winter.py)")
+    window = Program(41, 13, "LORENZ SZ", killKey="escape")
+    main = Main()
+    window.Run(main)
+    print(main.machine.ciphertext)
\ No newline at end of file
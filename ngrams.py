@@ -0,0 +1,106 @@
+# EXTERNAL DEPENDENCIES: numpy
+
+# N-gram language scoring for attacks on Enigma and Lorenz output.
+#
+# A table holds the log10 probability of every n-gram over one alphabet as float32, indexed by the
+# n-gram read as a number in base len(alphabet). It is built once from a corpus and every process
+# maps the same file read-only, so the operating system keeps a single copy in memory.
+
+from __future__ import annotations
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from typing import Iterable
+import numpy as np
+import sys
+
+ALPHABETS = {
+    "latin": "ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+    "ita2": "!T^O HNM$LRGIPCVEZDBSYFXAWJ#UQK@",  # ordered by code, same symbols as BAUDOT in lorenz.py
+}
+ALPHABET_IDS = list(ALPHABETS)
+
+# magic, version, n, alphabet id, padded so the scores start aligned
+HEADER = Struct("<2sBBB3x")
+MAGIC = b"NG"
+VERSION = 1
+
+def encode(text: str, alphabet: str = "latin"):
+    letters = ALPHABETS[alphabet]
+    table = bytes.maketrans(letters.encode(), bytes(range(len(letters))))
+    drop = bytes(c for c in range(128) if chr(c) not in letters)
+    return np.frombuffer(text.upper().encode("ascii", "ignore").translate(table, drop), dtype = np.uint8)
+
+def ngram_codes(indices: np.ndarray, n: int, size: int):
+    count = indices.shape[-1] - n + 1
+    if count <= 0:
+        return np.zeros(indices.shape[:-1] + (0,), dtype = np.int64)
+    codes = np.zeros(indices.shape[:-1] + (count,), dtype = np.int64)
+    for i in range(n):
+        codes = codes * size + indices[..., i : i + count]
+    return codes
+
+def build_table(path: str, corpus: Iterable[str], n: int, alphabet: str = "latin"):
+    size = len(ALPHABETS[alphabet])
+    counts = np.zeros(size ** n, dtype = np.int64)
+    for text in corpus:
+        codes = ngram_codes(encode(text, alphabet), n, size)
+        counts += np.bincount(codes, minlength = size ** n)
+    total = max(int(counts.sum()), 1)
+    scores = np.log10(np.maximum(counts, 0.01) / total).astype("<f4")
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, n, ALPHABET_IDS.index(alphabet)))
+        f.write(scores.tobytes())
+
+class NgramTable:
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+        (magic, version, self.n, alphabet) = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not an n-gram table of a supported version")
+        self.alphabet = ALPHABET_IDS[alphabet]
+        self.size = len(ALPHABETS[self.alphabet])
+        self.scores = np.frombuffer(self.data, dtype = "<f4", count = self.size ** self.n, offset = HEADER.size)
+
+    def encode(self, text: str):
+        return encode(text, self.alphabet)
+
+    def score(self, text: str|np.ndarray):
+        indices = self.encode(text) if isinstance(text, str) else text
+        return float(self.scores[ngram_codes(indices, self.n, self.size)].sum())
+
+    def score_batch(self, texts: list[str]|np.ndarray):
+        # a 2D array of alphabet indices (one candidate per row) is scored without any conversion
+        if isinstance(texts, np.ndarray):
+            return self.scores[ngram_codes(texts, self.n, self.size)].sum(axis = -1, dtype = np.float64)
+        if len(texts) == 0:
+            return np.zeros(0)
+        encoded = [self.encode(t) for t in texts]
+        lengths = np.array([len(e) for e in encoded], dtype = np.int64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        windows = self.scores[ngram_codes(np.concatenate(encoded), self.n, self.size)]
+        # windows crossing from one text into the next start past the last full window of a text, so they drop out of its range;
+        # a text shorter than n has no windows and may start past the last window, so both ends are clipped to score it 0
+        total = np.concatenate(([0.0], np.cumsum(windows, dtype = np.float64)))
+        ends = np.minimum(starts + np.maximum(lengths - self.n + 1, 0), len(windows))
+        starts = np.minimum(starts, len(windows))
+        return total[ends] - total[starts]
+
+    def close(self):
+        self.scores = None
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4 or sys.argv[3] not in ("1", "2", "3", "4"):
+        print(f"usage: python {sys.argv[0]} corpus.txt table.bin n(1-4) [{'|'.join(ALPHABETS)}]")
+        sys.exit(1)
+    with open(sys.argv[1], encoding = "utf-8") as f:
+        build_table(sys.argv[2], f, int(sys.argv[3]), sys.argv[4] if len(sys.argv) > 4 else "latin")
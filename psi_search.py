@@ -0,0 +1,141 @@
+# EXTERNAL DEPENDENCIES: numpy
+
+# Motor and psi setting search for the last stage of a Lorenz break.
+#
+# Once the chi wheels are known and removed, the de-chi'd text is the plaintext XOR the inverted psi
+# stream. The psi wheels only move when the M37 pin is set, so instead of stepping a machine letter by
+# letter the psi stream is read from the cumulative count of motor-enabled steps. For every motor
+# setting each psi wheel is scored on its own channel against the plaintext bit statistics (a circular
+# correlation over at most 59 starts), only the best motor settings are kept, and for those the best
+# psi starts of every wheel are combined and scored as text with an n-gram table.
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from heapq import nlargest
+from itertools import product
+from typing import NamedTuple
+from lorenz import BAUDOT, LorenzSZ
+from ngrams import ALPHABETS, NgramTable
+import numpy as np
+import sys
+
+class Setting(NamedTuple):
+    score: float
+    motor: tuple[int, int]
+    psi: tuple[int, ...]
+    plaintext: str
+
+    def apply(self, machine: LorenzSZ):
+        for (wheel, position) in zip(machine.motor_wheels, self.motor):
+            wheel.position = position
+        for (wheel, position) in zip(machine.psi_wheels, self.psi):
+            wheel.position = position
+
+def to_codes(text: str):
+    return np.array([int(BAUDOT[c], 2) for c in text if c in BAUDOT], dtype = np.uint8)
+
+def to_text(codes: np.ndarray):
+    return "".join(ALPHABETS["ita2"][c] for c in codes)
+
+def exclusive_cumsum(bits: np.ndarray):
+    return np.cumsum(bits, dtype = np.int64) - bits
+
+def remove_chi(ciphertext: str, machine: LorenzSZ):
+    codes = to_codes(ciphertext)
+    t = np.arange(len(codes))
+    for (i, wheel) in enumerate(machine.chi_wheels):
+        pins = np.array(wheel.pins, dtype = np.uint8)
+        codes ^= pins[(wheel.position + t) % wheel.size] << (4 - i)
+    return codes
+
+# how many times the psi wheels have moved before each letter, same order of events as LorenzSZ.step_wheels
+def motor_counts(m37: np.ndarray, m61: np.ndarray, start37: int, start61: int, length: int):
+    m61_bits = m61[(start61 + np.arange(length)) % len(m61)]
+    enabled = m37[(start37 + exclusive_cumsum(m61_bits)) % len(m37)]
+    return exclusive_cumsum(enabled)
+
+def extended_psi(psi: list[np.ndarray], starts: tuple[int, ...], counts: np.ndarray):
+    codes = np.zeros(len(counts), dtype = np.uint8)
+    for (i, (pins, start)) in enumerate(zip(psi, starts)):
+        codes |= pins[(start + counts) % len(pins)] << (4 - i)
+    return codes
+
+class PsiSearch:
+    def __init__(self, dechi: np.ndarray, machine: LorenzSZ, monograms: np.ndarray, beam: int = 3):
+        self.dechi = dechi
+        self.beam = beam
+        self.m37 = np.array(machine.motor_wheels[0].pins, dtype = np.uint8)
+        self.m61 = np.array(machine.motor_wheels[1].pins, dtype = np.uint8)
+        self.psi = [np.array(wheel.pins, dtype = np.uint8) for wheel in machine.psi_wheels]
+        # rotations[s][j] is the pin that meets offset j when the wheel starts at s
+        self.rotations = [np.array([np.roll(pins, -s) for s in range(len(pins))], dtype = np.float64) for pins in self.psi]
+        # the plaintext bit is dechi ^ 1 when the psi pin is 0 and dechi when it is 1,
+        # so a set pin moves the log likelihood by +-(log P(bit = 1) - log P(bit = 0))
+        codes = np.arange(len(monograms))
+        self.weights = []
+        for i in range(len(self.psi)):
+            bit = (self.dechi >> (4 - i)) & 1
+            p1 = monograms[(codes >> (4 - i)) & 1 == 1].sum()
+            self.weights.append((2.0 * bit - 1.0) * (np.log10(p1) - np.log10(1.0 - p1)))
+
+    def score_motors(self, starts61: list[int], keep: int):
+        candidates = []
+        for start61 in starts61:
+            for start37 in range(len(self.m37)):
+                counts = motor_counts(self.m37, self.m61, start37, start61, len(self.dechi))
+                bound, starts = 0.0, []
+                for (rotations, weights) in zip(self.rotations, self.weights):
+                    scores = rotations @ np.bincount(counts % len(rotations), weights = weights, minlength = len(rotations))
+                    best = np.argsort(scores)[::-1][:self.beam]
+                    bound += scores[best[0]]
+                    starts.append([int(s) for s in best])
+                candidates.append((bound, start37, start61, starts))
+            candidates = nlargest(keep, candidates, key = lambda c: c[0])
+        return candidates
+
+    def rescore(self, candidate: tuple, table: NgramTable):
+        (bound, start37, start61, starts) = candidate
+        counts = motor_counts(self.m37, self.m61, start37, start61, len(self.dechi))
+        combos = list(product(*starts))
+        plain = np.array([self.dechi ^ 31 ^ extended_psi(self.psi, combo, counts) for combo in combos])
+        scores = table.score_batch(plain)
+        best = int(np.argmax(scores))
+        return Setting(float(scores[best]), (start37, start61), combos[best], to_text(plain[best]))
+
+# every worker opens the n-gram table itself, the mapping is shared through the page cache
+worker_search: PsiSearch = None
+worker_table: NgramTable = None
+
+def init_worker(search: PsiSearch, table_path: str):
+    global worker_search, worker_table
+    worker_search = search
+    worker_table = NgramTable(table_path)
+
+def score_motors_in_worker(starts61: list[int], keep: int):
+    return worker_search.score_motors(starts61, keep)
+
+def rescore_in_worker(candidate: tuple):
+    return worker_search.rescore(candidate, worker_table)
+
+def search(dechi: str|np.ndarray, machine: LorenzSZ, table_path: str, keep: int = 20, beam: int = 3, workers: int = None):
+    with NgramTable(table_path) as table:
+        if table.alphabet != "ita2":
+            raise ValueError(f"{table_path} does not score the ITA2 alphabet")
+        # letter frequencies of the plaintext, marginalised out of whatever n the table has
+        monograms = (10.0 ** table.scores.astype(np.float64)).reshape((table.size,) * table.n).sum(axis = tuple(range(1, table.n)))
+    state = PsiSearch(to_codes(dechi) if isinstance(dechi, str) else np.asarray(dechi, dtype = np.uint8), machine, monograms / monograms.sum(), beam)
+    chunks = [[s] for s in range(len(state.m61))]
+    with ProcessPoolExecutor(workers, initializer = init_worker, initargs = (state, table_path)) as pool:
+        candidates = [c for part in pool.map(score_motors_in_worker, chunks, [keep] * len(chunks)) for c in part]
+        candidates = nlargest(keep, candidates, key = lambda c: c[0])
+        return sorted(pool.map(rescore_in_worker, candidates), reverse = True)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(f"usage: python {sys.argv[0]} machine.snapshot table.bin [keep] < dechi.txt")
+        print("  the snapshot provides the psi and motor pins, the de-chi'd text is read as ITA2 letters")
+        sys.exit(1)
+    with open(sys.argv[1], "rb") as f:
+        machine = LorenzSZ().load(f.read())
+    for s in search(sys.stdin.read(), machine, sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 20)[:5]:
+        print(f"{s.score:10.1f}  M37 {s.motor[0] + 1:2} M61 {s.motor[1] + 1:2}  psi {' '.join(str(p + 1) for p in s.psi)}  {s.plaintext[:40]}")
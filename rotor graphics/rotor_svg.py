@@ -1,6 +1,11 @@
 # EXTERNAL DEPENDENCIES: svgwrite
 
 import math
+import os
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from svgwrite import Drawing
 
 def ntol(n: int):
@@ -9,18 +14,29 @@ def ntol(n: int):
 def lton(l: str):
     return (ord(l[:1].upper()) - 65) % 26
 
-def generate_enigma_rotor_svg(wiring, filename = "rotor.svg", size = 500):
+# contact i of a rotor turned to `position` sits where letter i + position is
+@lru_cache(maxsize = None)
+def letter_positions(size = 500, position = 0):
+    wide_width = size/200
+    center = (size + wide_width) / 2
+    letter_radius = size / 2 * 0.95
+    positions = []
+    for i in range(26):
+        angle = 2 * math.pi * (i + position) / 26 - math.pi/2
+        positions.append((center + letter_radius * math.cos(angle), center + letter_radius * math.sin(angle)))
+    return tuple(positions)
+
+def generate_enigma_rotor_svg(wiring, filename = "rotor.svg", size = 500, position = 0):
     wide_width = size/200
     thin_width = wide_width/8
     outer_radius = size / 2
     inner_radius = outer_radius * (7.25 / 24)
-    letter_radius = outer_radius * 0.95
     dot_radius = outer_radius * 0.005
     dot_outer = dot_radius * 4
     arrow_offset = outer_radius * 0.025
     arrow_size = wide_width * 4
 
-    dwg = Drawing(filename, size=(size + wide_width, size + wide_width), profile='tiny')
+    dwg = Drawing(filename, size=(size + wide_width, size + wide_width), profile='tiny', debug=False)
     center = (size + wide_width) / 2
     
     dwg.add(dwg.circle(center = (center, center), r = outer_radius, fill = 'none', stroke = 'black', stroke_width = wide_width))
@@ -30,18 +46,13 @@ def generate_enigma_rotor_svg(wiring, filename = "rotor.svg", size = 500):
     dwg.add(dwg.line((center - cross_size, center), (center + cross_size, center), stroke = 'black', stroke_width = thin_width))
     dwg.add(dwg.line((center, center - cross_size), (center, center + cross_size), stroke = 'black', stroke_width = thin_width))
     
-    letter_positions = []
-    for i in range(26):
-        angle = 2 * math.pi * i / 26 - math.pi/2
-        x = center + letter_radius * math.cos(angle)
-        y = center + letter_radius * math.sin(angle)
-        letter_positions.append((x, y))
+    positions = letter_positions(size, position)
     
     for i in range(26):
-        start_pos = letter_positions[i]
+        start_pos = positions[i]
         end_letter = wiring[i]
         end_idx = ord(end_letter) - ord('A')
-        end_pos = letter_positions[end_idx]
+        end_pos = positions[end_idx]
         
         dwg.add(dwg.circle(center=start_pos, r=2.5, fill='black'))
 
@@ -73,9 +84,62 @@ def generate_enigma_rotor_svg(wiring, filename = "rotor.svg", size = 500):
     
     dwg.save()
 
-while True:
-    inp = input().split()
-    if len(inp) < 2:
-        break
-    [wiring, filename] = inp
-    generate_enigma_rotor_svg(wiring, filename)
\ No newline at end of file
+def read_mappings(path):
+    jobs = []
+    with open(path) as f:
+        for line in f:
+            inp = line.split()
+            if len(inp) >= 2:
+                jobs.append((inp[0], inp[1]))
+    return jobs
+
+def table_mappings():
+    # needs enigma.py from the parent folder
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from enigma import rotors, reflectors
+    jobs = []
+    for rotor in rotors.values():
+        if rotor.name != "NaN":
+            jobs.append(("".join(ntol(n) for n in rotor.wiring), f"rotor_{rotor.name}.svg"))
+    for reflector in reflectors.values():
+        jobs.append(("".join(reflector.Transform(ntol(n)) for n in range(26)), f"reflector_{reflector.name}.svg"))
+    return jobs
+
+def render(job):
+    (wiring, filename, size, position) = job
+    generate_enigma_rotor_svg(wiring, filename, size, position)
+    return filename
+
+def generate_batch(mappings, out_dir = ".", size = 500, frames = False, workers = None):
+    jobs = []
+    for (wiring, filename) in mappings:
+        path = os.path.join(out_dir, filename)
+        if frames:
+            (base, ext) = os.path.splitext(path)
+            jobs += [(wiring, f"{base}_{ntol(p)}{ext}", size, p) for p in range(26)]
+        else:
+            jobs.append((wiring, path, size, 0))
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(render, jobs, chunksize = 8))
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description = "Draws Enigma rotor and reflector wirings as SVG. Without a source, reads 'wiring filename' lines from stdin.")
+    parser.add_argument("mappings", nargs = "?", help = "file with 'wiring filename' lines, e.g. mappings.txt")
+    parser.add_argument("--tables", action = "store_true", help = "draw every rotor and reflector from enigma.py")
+    parser.add_argument("--frames", action = "store_true", help = "also draw the wiring turned to every position, as <name>_A.svg ... <name>_Z.svg")
+    parser.add_argument("--out", default = ".", help = "output folder for batch mode")
+    parser.add_argument("--size", type = int, default = 500)
+    parser.add_argument("--workers", type = int, default = None)
+    args = parser.parse_args()
+
+    if args.mappings or args.tables:
+        mappings = table_mappings() if args.tables else read_mappings(args.mappings)
+        for filename in generate_batch(mappings, args.out, args.size, args.frames, args.workers):
+            print(filename)
+    else:
+        for line in sys.stdin:
+            inp = line.split()
+            if len(inp) < 2:
+                break
+            [wiring, filename] = inp
+            generate_enigma_rotor_svg(wiring, filename, args.size)
\ No newline at end of file
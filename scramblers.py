@@ -0,0 +1,103 @@
+# Precomputed plugboard-free scrambler permutations of a 3-rotor Enigma.
+#
+# For every rotor order (3 of the chosen rotors, fastest first as in the simulator), every reflector
+# and every one of the 17,576 positions the file holds the 26 byte permutation the rotors and the
+# reflector apply at that position, the same one FastEnigma uses for a letter typed there (after
+# stepping, without the plugboard). The file is mapped read-only, so every process shares one copy.
+#
+# The rotor tables only depend on position - ring, so a ring setting is just an offset into the table.
+#
+# layout: header, then one block of 17,576 x 26 bytes per (rotor order, reflector), rotor orders in
+# itertools.permutations order, reflectors innermost; a position is found at (p0 * 26 + p1) * 26 + p2
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from itertools import permutations
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+from enigma import FastEnigma, rotors, reflectors, lton
+import sys
+
+# magic, version, rotor ids, reflector ids
+HEADER = Struct("<2sBx16s8s4x")
+MAGIC = b"SC"
+VERSION = 1
+POSITIONS = 26 ** 3
+BLOCK = POSITIONS * 26
+
+# 256 byte translation tables, so permutations compose with bytes.translate
+def Table(mapping: list[int]):
+    return bytes(mapping) + bytes(range(len(mapping), 256))
+
+def BuildBlock(job: tuple[str, str]):
+    (order, reflector) = job
+    machine = FastEnigma(order, reflector)
+    forward = [[Table(p) for p in rotor] for rotor in machine.forward]
+    inverse = [[Table(p) for p in rotor] for rotor in machine.inverse]
+    reflect = Table(machine.reflect)
+    # the slowest rotor and the reflector first, then wrap the faster rotors around them
+    inner = [forward[2][p2].translate(reflect).translate(inverse[2][p2]) for p2 in range(26)]
+    block = bytearray()
+    for p0 in range(26):
+        for p1 in range(26):
+            (f0, i0, f1, i1) = (forward[0][p0], inverse[0][p0], forward[1][p1], inverse[1][p1])
+            for p2 in range(26):
+                block += f0.translate(f1.translate(inner[p2]).translate(i1)).translate(i0)[:26]
+    return bytes(block)
+
+def BuildTable(path: str, rotor_ids: str = "12345678", reflector_ids: str = "ABC", workers: int = None):
+    for i in rotor_ids:
+        if i not in rotors or rotors[i].fixed:
+            raise ValueError(f"{i!r} is not a stepping rotor")
+    for i in reflector_ids:
+        if i not in reflectors:
+            raise ValueError(f"{i!r} is not a reflector")
+    if len(rotor_ids) < 3 or len(rotor_ids) > 16 or len(reflector_ids) > 8:
+        raise ValueError("a table holds 3 to 16 rotors and up to 8 reflectors")
+    if len(set(rotor_ids)) != len(rotor_ids) or len(set(reflector_ids)) != len(reflector_ids):
+        raise ValueError("rotor and reflector ids must not repeat")
+    jobs = [("".join(order), reflector) for order in permutations(rotor_ids, 3) for reflector in reflector_ids]
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, rotor_ids.encode(), reflector_ids.encode()))
+        with ProcessPoolExecutor(workers) as pool:
+            for block in pool.map(BuildBlock, jobs):
+                f.write(block)
+
+class ScramblerTable:
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.data = mmap(self.file.fileno(), 0, access = ACCESS_READ)
+        (magic, version, rotor_ids, reflector_ids) = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            self.Close()
+            raise ValueError(f"{path} is not a scrambler table of a supported version")
+        self.rotor_ids = rotor_ids.rstrip(b"\0").decode()
+        self.reflector_ids = reflector_ids.rstrip(b"\0").decode()
+        self.blocks: dict[tuple[str, str], int] = {}
+        for order in permutations(self.rotor_ids, 3):
+            for reflector in self.reflector_ids:
+                self.blocks["".join(order), reflector] = HEADER.size + len(self.blocks) * BLOCK
+        if len(self.data) < HEADER.size + len(self.blocks) * BLOCK:
+            self.Close()
+            raise ValueError(f"{path} is truncated")
+    # a view into the mapping without copying, it has to be released before Close()
+    def Block(self, order: str|list[str], reflector: str):
+        offset = self.blocks["".join(order), reflector]
+        return memoryview(self.data)[offset : offset + BLOCK]
+    def Permutation(self, order: str|list[str], reflector: str, positions: str|tuple[int, ...], rings: str = "AAA"):
+        (p0, p1, p2) = ((lton(p) if type(p) == str else p) - lton(r) for (p, r) in zip(positions, rings))
+        offset = self.blocks["".join(order), reflector] + (((p0 % 26) * 26 + p1 % 26) * 26 + p2 % 26) * 26
+        return self.data[offset : offset + 26]
+    def Close(self):
+        self.data.close()
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.Close()
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"usage: python {sys.argv[0]} table.bin [rotor ids, default 12345678] [reflector ids, default ABC] [workers]")
+        sys.exit(1)
+    BuildTable(sys.argv[1], *sys.argv[2:4], *[int(w) for w in sys.argv[4:5]])
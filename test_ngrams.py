@@ -0,0 +1,11 @@
+import numpy as np
+from ngrams import NgramTable, build_table
+
+CORPUS = ["THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG" * 20]
+
+def test_score_batch_short_last_candidate(tmp_path):
+    for n in (2, 4):
+        build_table(tmp_path / f"{n}.bin", CORPUS, n)
+        with NgramTable(tmp_path / f"{n}.bin") as table:
+            for batch in (["HELLO", ""], ["ABCDEF", "CD"], [""], ["THE", "", "FOXJUMPS", "Q"]):
+                assert np.allclose(table.score_batch(batch), [table.score(text) for text in batch])
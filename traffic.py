@@ -0,0 +1,146 @@
+# Bulk decoding of Enigma traffic from a key sheet.
+#
+# key sheet, one day per line:
+#     day  reflector  rotors        rings  plugboard pairs...
+#     12   B          I,IV,II       ZFA    AV BS CG DL FU HZ IN KM OW RX
+#     13   C-thin     V,I,VI,Gamma  KMAP   AT BL DF GJ HM NW OP QY RZ VX
+# messages, one per line:
+#     day  ground  indicator  text...
+#     12   WXC     KCHKCH     QBLTW LDAHH YEOEF PTWYB LENDP MKOXL DFAMU DWIJD XRJZ
+#
+# Rotors and rings are listed in the same order as in the simulator, fastest rotor first. A day uses
+# 3 different stepping rotors with a thick reflector, or the M4 layout: 3 different stepping rotors,
+# then Beta or Gamma, with a thin reflector. Plugboard pairs are two different letters and no letter
+# is plugged twice. Letters and names are not case sensitive, and both files allow # comments.
+# The ground setting is sent in clear, the indicator is the message key (one letter per
+# rotor) enciphered at the ground setting, either once or doubled.
+
+from __future__ import annotations
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, NamedTuple
+from enigma import FastEnigma, ROTOR_IDS, REFLECTOR_IDS, THIN_REFLECTORS, rotors
+import os
+import sys
+
+ROTOR_NAMES = {name.upper(): key for (name, key) in ROTOR_IDS.items()}
+REFLECTOR_NAMES = {name.upper(): key for (name, key) in REFLECTOR_IDS.items()}
+LETTERS = set("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
+
+class Message(NamedTuple):
+    day: str
+    ground: str
+    indicator: str
+    text: str
+
+class Decoded(NamedTuple):
+    message: Message
+    key: str|None
+    plaintext: str|None
+
+class DailyKey:
+    def __init__(self, day: str, order: list[str], reflector: str, rings: str = "", plugboard: list[str] = []):
+        self.day = day
+        self.machine = FastEnigma(order, reflector, plugboard, rings)
+    def Decode(self, message: Message):
+        n = len(self.machine.order)
+        self.machine.SetPositions(message.ground)
+        key = self.machine.Encode(message.indicator)
+        if len(key) == 2 * n:
+            if key[:n] != key[n:]:
+                return Decoded(message, None, None)
+            key = key[:n]
+        elif len(key) != n:
+            return Decoded(message, None, None)
+        self.machine.SetPositions(key)
+        return Decoded(message, key, self.machine.Encode(message.text))
+
+def ReadKeySheet(lines: Iterable[str]):
+    keys: dict[str, DailyKey] = {}
+    for line in lines:
+        fields = line.split("#")[0].split()
+        if not fields:
+            continue
+        if len(fields) < 4:
+            raise ValueError(f"incomplete key sheet line: {line.strip()!r}")
+        (day, reflector, order, rings, *plugboard) = fields
+        order = order.upper().split(",")
+        for name in order:
+            if name not in ROTOR_NAMES:
+                raise ValueError(f"unknown rotor {name!r} on day {day}")
+        if reflector.upper() not in REFLECTOR_NAMES:
+            raise ValueError(f"unknown reflector {reflector!r} on day {day}")
+        if len(set(order)) != len(order):
+            raise ValueError(f"day {day} uses a rotor more than once")
+        ids = [ROTOR_NAMES[name] for name in order]
+        reflector = REFLECTOR_NAMES[reflector.upper()]
+        fixed = [rotors[i].fixed for i in ids]
+        if reflector in THIN_REFLECTORS or any(fixed):
+            if fixed != [False, False, False, True] or reflector not in THIN_REFLECTORS:
+                raise ValueError(f"day {day} mixes M4 parts, a greek rotor has to be the last of 4 rotors with a thin reflector")
+        elif len(order) != 3:
+            raise ValueError(f"day {day} has {len(order)} rotors, a thick reflector needs 3")
+        (rings, plugboard) = (rings.upper(), [pair.upper() for pair in plugboard])
+        if len(rings) != len(order):
+            raise ValueError(f"day {day} has {len(order)} rotors but {len(rings)} ring settings")
+        if not set(rings) <= LETTERS:
+            raise ValueError(f"ring settings {rings!r} are not letters A-Z on day {day}")
+        for pair in plugboard:
+            if len(pair) != 2 or pair[0] == pair[1] or not set(pair) <= LETTERS:
+                raise ValueError(f"plugboard pair {pair!r} is not two different letters A-Z on day {day}")
+        plugged = "".join(plugboard)
+        if len(set(plugged)) != len(plugged):
+            raise ValueError(f"plugboard uses a letter more than once on day {day}")
+        keys[day] = DailyKey(day, ids, reflector, rings, plugboard)
+    return keys
+
+def ReadMessages(lines: Iterable[str]):
+    for line in lines:
+        fields = line.split("#")[0].split()
+        if not fields:
+            continue
+        if len(fields) < 3:
+            raise ValueError(f"incomplete message line: {line.strip()!r}")
+        (day, ground, indicator, *text) = fields
+        yield Message(day, ground.upper(), indicator.upper(), " ".join(text))
+
+# every worker receives the precomputed daily keys once, messages are sent on their own
+worker_keys: dict[str, DailyKey] = {}
+
+def InitWorker(keys: dict[str, DailyKey]):
+    global worker_keys
+    worker_keys = keys
+
+def DecodeInWorker(message: Message):
+    return worker_keys[message.day].Decode(message)
+
+def DecodeTraffic(keys: dict[str, DailyKey], messages: Iterable[Message], workers: int = None, chunksize: int = 64):
+    def checked():
+        for m in messages:
+            if m.day not in keys:
+                raise ValueError(f"no key for day {m.day!r}")
+            if len(m.ground) != len(keys[m.day].machine.order) or not set(m.ground) <= LETTERS:
+                raise ValueError(f"ground setting {m.ground!r} does not have one letter A-Z per rotor of day {m.day}")
+            yield m
+    if workers == 1:
+        for m in checked():
+            yield keys[m.day].Decode(m)
+        return
+    # the stream is submitted one batch (a chunk per worker) at a time, so it is never read ahead further than that
+    batch_size = (workers or os.cpu_count() or 1) * chunksize
+    stream = checked()
+    with ProcessPoolExecutor(workers, initializer = InitWorker, initargs = (keys,)) as pool:
+        while batch := list(islice(stream, batch_size)):
+            yield from pool.map(DecodeInWorker, batch, chunksize = chunksize)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(f"usage: python {sys.argv[0]} keysheet.txt [workers] < messages.txt")
+        sys.exit(1)
+    with open(sys.argv[1]) as f:
+        keys = ReadKeySheet(f)
+    for d in DecodeTraffic(keys, ReadMessages(sys.stdin), int(sys.argv[2]) if len(sys.argv) > 2 else None):
+        if d.key is None:
+            print(f"{d.message.day} {d.message.ground} {d.message.indicator} ! indicator does not decode")
+        else:
+            print(f"{d.message.day} {d.message.ground} {d.message.indicator} {d.key} {d.plaintext}")